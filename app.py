@@ -1,154 +1,444 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import lxml.html
+from lxml import etree
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from langchain_community.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 import pandas as pd
 import json
-from scrapy.crawler import CrawlerProcess
-from scrapy.utils.project import get_project_settings
-from scrapy import Spider
-import tempfile
 import os
+import atexit
+import asyncio
+import aiohttp
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Initialize AI model
-llm = ChatOpenAI(temperature=0.7, model="gpt-4")
+# Compiled once at import so each scrape only pays for the tree walk
+HEADER_TAGS = ('h1', 'h2', 'h3')
+XP_TITLE = etree.XPath('string(//title)')
+XP_BODY = etree.XPath('//body')
+XP_SCRIPT_COUNT = etree.XPath('count(//script)')
+INVISIBLE_TAGS = frozenset(('script', 'style', 'noscript', 'template'))
 
-def get_page_content(url):
-    """Improved content fetcher with headers and Selenium fallback"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Referer': 'https://www.google.com/',
-    }
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Referer': 'https://www.google.com/',
+}
+
+# Chat models for question suggestions; override with the LLM_MODEL and
+# LLM_LARGE_MODEL env vars. The large one is opt-in from the sidebar.
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "gpt-4o")
+
+# How long and how many finished AI answers are kept for reuse
+ANSWER_TTL = 3600
+ANSWER_MAX_ENTRIES = 256
+
+# Cap on bytes downloaded per page; downstream only uses a bounded slice
+MAX_BYTES = 512 * 1024
+
+# Seconds a browser page load may take; matches the HTTP fetch timeout so
+# one hanging page can't hold the shared driver lock for minutes
+PAGE_LOAD_TIMEOUT = 10
+
+# Resource types the headless browser never needs to download
+BLOCKED_RESOURCES = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.css', '*.woff', '*.woff2', '*.ttf', '*.otf',
+    '*.mp4', '*.webm', '*.mp3',
+]
+
+def parse_html(page):
+    """Parse a (body, encoding) page with lxml; with no charset lxml sniffs <meta>"""
+    body, encoding = page
+    if encoding:
+        try:
+            parser = lxml.html.HTMLParser(encoding=encoding)
+        except LookupError:
+            # Unknown or malformed header charset; let lxml read <meta> instead
+            parser = None
+        if parser is not None:
+            return lxml.html.fromstring(body, parser=parser)
+    return lxml.html.fromstring(body)
+
+@st.cache_resource
+def get_llm(model=LLM_MODEL):
+    """AI model client, kept alive across reruns"""
+    # Five short questions never need more than a few hundred tokens
+    return ChatOpenAI(temperature=0.3, model=model, max_tokens=300, streaming=True)
+
+@st.cache_resource
+def get_executor():
+    """Worker pool for overlapping network-bound steps of an analysis"""
+    return ThreadPoolExecutor(max_workers=4)
+
+def submit(fn, *args):
+    """Run fn on the shared pool with this session's Streamlit context attached"""
+    ctx = get_script_run_ctx()
     
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+    
+    return get_executor().submit(run)
+
+@st.cache_resource
+def get_session():
+    """Shared HTTP session so keep-alive connections survive reruns"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=10,
+        max_retries=Retry(total=2, backoff_factor=0.3)
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+@st.cache_data(ttl=600, max_entries=128, show_spinner=False)
+def fetch_page(url, max_bytes=MAX_BYTES):
+    """Cached HTTP fetch; failures raise so they are never memoized.
+    
+    Returns an undecoded (body, encoding) tuple, where encoding is the
+    charset the server declared or None. A plain tuple keeps the
+    st.cache_data pickle free of app-defined classes.
+    """
+    with get_session().get(url, headers=REQUEST_HEADERS, timeout=10, stream=True) as response:
         response.raise_for_status()
-        return response.text
+        body = response.raw.read(max_bytes, decode_content=True)
+        # Only trust an explicit charset; requests' ISO-8859-1 default for
+        # text/* would otherwise override the page's own <meta charset>
+        declared = 'charset' in response.headers.get('Content-Type', '').lower()
+        return body, response.encoding if declared else None
+
+def get_page_content(url, max_bytes=MAX_BYTES):
+    """Improved content fetcher with headers and Selenium fallback.
+    
+    Returns fetch_page's (body, encoding) tuple on success or an error
+    message string.
+    """
+    try:
+        return fetch_page(url, max_bytes)
     except requests.exceptions.HTTPError as e:
         if e.response.status_code == 403:
             st.warning("Requests blocked, falling back to Selenium...")
-            return selenium_fetch(url)
+            html = selenium_fetch(url)
+            if html.startswith("Selenium Error:"):
+                return html
+            return html.encode('utf-8'), 'utf-8'
         return f"Error: {str(e)}"
     except Exception as e:
         return f"Error: {str(e)}"
 
-def selenium_fetch(url):
-    """Headless browser fetch for JS-heavy or protected sites"""
+@st.cache_resource
+def get_driver():
+    """Single headless Chrome instance reused by all Selenium calls"""
     options = Options()
+    # Return at DOMContentLoaded instead of waiting on every sub-resource
+    options.page_load_strategy = 'eager'
     options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-background-timer-throttling")
+    options.add_argument("--disable-backgrounding-occluded-windows")
+    options.add_argument("--disable-renderer-backgrounding")
+    options.add_argument("--mute-audio")
+    options.add_argument("--no-first-run")
     options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
+    # Only the DOM and text are read, so skip downloading media and styling
+    options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.stylesheets": 2,
+        "profile.managed_default_content_settings.fonts": 2,
+    })
     
+    driver = webdriver.Chrome(options=options)
+    atexit.register(driver.quit)
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_RESOURCES})
+    return driver
+
+@st.cache_resource
+def get_driver_lock():
+    """Serializes use of the shared driver across threads and sessions"""
+    return threading.Lock()
+
+def driver_alive(driver):
+    """Whether the browser behind driver still answers commands"""
     try:
-        driver = webdriver.Chrome(options=options)
+        driver.current_url
+        return True
+    except WebDriverException:
+        return False
+
+def run_with_driver(action):
+    """Run action(driver) under the driver lock, rebuilding Chrome once if it died"""
+    with get_driver_lock():
+        driver = get_driver()
+        try:
+            return action(driver)
+        except TimeoutException:
+            raise
+        except WebDriverException:
+            if driver_alive(driver):
+                raise
+        
+        # Crashed browser or lost session: drop the cached driver and retry
+        atexit.unregister(driver.quit)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        get_driver.clear()
+        return action(get_driver())
+
+def wait_for_body(driver, timeout=5):
+    """Block until the page body exists, returning the element"""
+    return WebDriverWait(driver, timeout).until(
+        EC.presence_of_element_located((By.TAG_NAME, 'body'))
+    )
+
+def selenium_fetch(url):
+    """Headless browser fetch for JS-heavy or protected sites"""
+    def fetch(driver):
         driver.get(url)
-        driver.implicitly_wait(5)
+        wait_for_body(driver)
         return driver.page_source
+    
+    try:
+        return run_with_driver(fetch)
+    except TimeoutException:
+        return f"Selenium Error: page did not load within {PAGE_LOAD_TIMEOUT}s"
     except Exception as e:
         return f"Selenium Error: {str(e)}"
-    finally:
-        if 'driver' in locals():
-            driver.quit()
 
-def generate_ai_questions(content):
-    """AI-powered question suggestion generator"""
-    if content.startswith("Error:"):
-        return "Could not generate questions due to: " + content
-    
+def iter_visible_text(node):
+    """Text chunks under node in document order, skipping comments and INVISIBLE_TAGS"""
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            yield item
+            continue
+        # The tail follows the element's subtree, so it goes on the stack first
+        if item is not node and item.tail:
+            stack.append(item.tail)
+        if not isinstance(item.tag, str) or item.tag in INVISIBLE_TAGS:
+            continue
+        if item.text:
+            yield item.text
+        stack.extend(reversed(item))
+
+def text_prefix(node, limit=1000):
+    """First `limit` chars of whitespace-collapsed visible text, stopping the walk early"""
+    words = []
+    size = 0
+    for chunk in iter_visible_text(node):
+        for word in chunk.split():
+            words.append(word)
+            size += len(word) + 1
+        if size > limit:
+            break
+    return ' '.join(words)[:limit]
+
+def body_text_prefix(tree, limit=1000):
+    """text_prefix of the <body> element, or of the whole tree if it has none"""
+    body = XP_BODY(tree)
+    return text_prefix(body[0] if body else tree, limit)
+
+def prompt_text(page, limit=3000):
+    """Visible page text for the AI prompt, walking only as far as limit chars"""
+    try:
+        tree = parse_html(page)
+    except Exception:
+        return ''
+    return text_prefix(tree, limit)
+
+def generate_ai_questions(page_text, model=LLM_MODEL):
+    """AI-powered question suggestion generator, yielding text as it streams"""
     prompt = ChatPromptTemplate.from_template(
         "Based on this webpage content, suggest 5 relevant scraping questions:"
         "\n\n{content}\n\nFormat as numbered list."
     )
-    chain = prompt | llm
-    return chain.invoke({"content": content[:3000]}).content
+    chain = prompt | get_llm(model)
+    for chunk in chain.stream({"content": page_text}):
+        yield chunk.content
 
-def bs4_scraper(url):
-    """BeautifulSoup-based scraper with structured data extraction"""
-    content = get_page_content(url)
+@st.cache_resource
+def get_answer_store():
+    """Finished AI answers shared by all sessions, with the lock guarding them.
     
-    if content.startswith("Error:") or content.startswith("Selenium Error:"):
+    Maps (model, page_text) to (stored_at, answer).
+    """
+    return {}, threading.Lock()
+
+def lookup_answer(model, page_text):
+    """Stored answer for this prompt, or None if missing or older than ANSWER_TTL"""
+    answers, lock = get_answer_store()
+    with lock:
+        entry = answers.get((model, page_text))
+    if entry is None or time.monotonic() - entry[0] > ANSWER_TTL:
+        return None
+    return entry[1]
+
+def store_answer(model, page_text, answer):
+    """Remember answer, dropping expired entries and the oldest beyond the cap"""
+    answers, lock = get_answer_store()
+    now = time.monotonic()
+    with lock:
+        for key in [k for k, (stored_at, _) in answers.items() if now - stored_at > ANSWER_TTL]:
+            del answers[key]
+        answers.pop((model, page_text), None)
+        answers[(model, page_text)] = (now, answer)
+        while len(answers) > ANSWER_MAX_ENTRIES:
+            del answers[next(iter(answers))]
+
+@st.cache_data(ttl=600, max_entries=128, show_spinner=False)
+def extract_structure(page):
+    """Title, headers with related links, all links and a text preview.
+    
+    Parse failures raise so that st.cache_data does not memoize them.
+    """
+    tree = parse_html(page)
+    
+    # Get headers with their context in one document-order pass: each
+    # header collects the next 3 links after it, like find_all_next did
+    headers = []
+    all_links = []
+    pending = []
+    for el in tree.iter(*HEADER_TAGS, 'a'):
+        if el.tag == 'a':
+            href = el.get('href')
+            if href is None:
+                continue
+            all_links.append(href)
+            if pending:
+                for header in pending:
+                    header['links'].append(href)
+                pending = [h for h in pending if len(h['links']) < 3]
+        else:
+            header = {
+                'text': el.text_content().strip(),
+                'tag': el.tag,
+                'links': []
+            }
+            headers.append(header)
+            pending.append(header)
+    
+    return {
+        'title': str(XP_TITLE(tree)) or 'No title',
+        'headers': headers,
+        'all_links': all_links,
+        'text': text_prefix(tree) + '...'
+    }
+
+def bs4_scraper(url, content=None):
+    """lxml-based scraper behind the "BeautifulSoup" tool, with structured data extraction"""
+    if content is None:
+        content = get_page_content(url)
+    
+    if isinstance(content, str):
         return {'error': content}
     
     try:
-        soup = BeautifulSoup(content, 'html.parser')
-        
-        # Get headers with their context
-        headers = []
-        for h in soup.find_all(['h1', 'h2', 'h3']):
-            headers.append({
-                'text': h.text.strip(),
-                'tag': h.name,
-                'links': [a['href'] for a in h.find_all_next('a', href=True, limit=3)]
-            })
-        
-        return {
-            'title': soup.title.string if soup.title else 'No title',
-            'headers': headers,
-            'all_links': [a['href'] for a in soup.find_all('a', href=True)],
-            'text': soup.get_text(separator=' ', strip=True)[:1000] + '...'
-        }
+        return extract_structure(content)
     except Exception as e:
         return {'error': str(e)}
 
-def selenium_scraper(url):
+def selenium_scraper(url, content=None):
     """Selenium-based scraper for JavaScript sites"""
-    options = Options()
-    options.add_argument("--headless=new")
-    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
+    if content is not None:
+        # Already-rendered HTML: read the same fields without a browser round-trip
+        if isinstance(content, str):
+            return {'error': content}
+        try:
+            tree = parse_html(content)
+            return {
+                'title': str(XP_TITLE(tree)),
+                'text': body_text_prefix(tree) + '...',
+                'scripts': int(XP_SCRIPT_COUNT(tree))
+            }
+        except Exception as e:
+            return {'error': str(e)}
     
-    try:
-        driver = webdriver.Chrome(options=options)
+    def scrape(driver):
         driver.get(url)
-        driver.implicitly_wait(5)
+        body = wait_for_body(driver)
         
         return {
             'title': driver.title,
-            'text': driver.find_element("tag name", 'body').text[:1000] + '...',
-            'scripts': len(driver.find_elements("tag name", 'script'))
+            'text': body.text[:1000] + '...',
+            'scripts': len(driver.find_elements(By.TAG_NAME, 'script'))
         }
+    
+    try:
+        return run_with_driver(scrape)
+    except TimeoutException:
+        return {'error': f"Page did not load within {PAGE_LOAD_TIMEOUT}s"}
     except Exception as e:
         return {'error': str(e)}
-    finally:
-        if 'driver' in locals():
-            driver.quit()
 
-class CustomSpider(Spider):
-    """Scrapy spider for advanced scraping"""
-    name = 'streamlit_spider'
-    
-    def parse(self, response):
-        yield {
-            'url': response.url,
-            'title': response.css('title::text').get(),
-            'content': response.css('body::text').get()[:1000] + '...'
-        }
+async def fetch_one(url, max_bytes=MAX_BYTES):
+    """Single-page async fetch, standing in for a one-URL Scrapy crawl"""
+    timeout = aiohttp.ClientTimeout(total=10)
+    async with aiohttp.ClientSession(headers=REQUEST_HEADERS, timeout=timeout) as session:
+        async with session.get(url, raise_for_status=True) as response:
+            # read(n) returns whatever is buffered, so keep pulling chunks
+            chunks = []
+            size = 0
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= max_bytes:
+                    break
+            return b''.join(chunks)[:max_bytes], response.charset
 
-def scrapy_scraper(url):
-    """Scrapy-based scraper with temp file handling"""
+def get_async_page_content(url):
+    """fetch_one driven by asyncio.run, returning an error string on failure"""
     try:
-        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
-            f.write(f"""
-import scrapy
-from scrapy.spiders import Spider
-
-class TempSpider(CustomSpider):
-    start_urls = ['{url}']
-""")
-        
-        process = CrawlerProcess(get_project_settings())
-        process.crawl(TempSpider)
-        process.start()
-        
-        return process.spider_loader.load('streamlit_spider').crawler.stats.get_stats()
+        return asyncio.run(fetch_one(url))
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+def scrapy_scraper(url, content=None):
+    """Async single-URL scraper (replaces the per-click Scrapy reactor)"""
+    if content is None:
+        content = get_async_page_content(url)
+    
+    if isinstance(content, str):
+        return {'error': content}
+    
+    try:
+        doc = parse_html(content)
+        return {
+            'url': url,
+            'title': str(XP_TITLE(doc)) or None,
+            'content': body_text_prefix(doc) + '...'
+        }
     except Exception as e:
         return {'error': str(e)}
-    finally:
-        if 'f' in locals() and os.path.exists(f.name):
-            os.unlink(f.name)
+
+SCRAPERS = {
+    "BeautifulSoup": bs4_scraper,
+    "Selenium": selenium_scraper,
+    "Scrapy": scrapy_scraper,
+}
 
 # Streamlit UI
 st.set_page_config(page_title="AI Web Scraping Agent", layout="wide")
@@ -160,6 +450,8 @@ with st.sidebar:
     tool = st.selectbox("Select Scraping Tool", 
                        ["BeautifulSoup", "Selenium", "Scrapy"])
     ai_enabled = st.checkbox("Enable AI Suggestions", True)
+    large_model = st.checkbox(f"Use {LLM_LARGE_MODEL} for suggestions", False,
+                              disabled=not ai_enabled)
 
 # Main interface
 col1, col2 = st.columns([1, 2])
@@ -168,22 +460,40 @@ with col1:
     st.header("Scraping Controls")
     if st.button("Analyze Page"):
         with st.spinner("Processing..."):
-            # Get basic content for AI suggestions
-            content = get_page_content(url)
+            # Selenium renders in a live browser, and Scrapy with AI off only
+            # needs its own aiohttp fetch, so start those before anything else
+            shares_content = tool == "BeautifulSoup" or (tool == "Scrapy" and ai_enabled)
+            if not shares_content:
+                scraper_future = submit(SCRAPERS[tool], url)
             
-            if ai_enabled and content and not content.startswith("Error:"):
-                with st.expander("AI Suggested Questions"):
-                    questions = generate_ai_questions(content)
-                    st.write(questions)
-                    
-            # Tool selection
-            if tool == "BeautifulSoup":
-                result = bs4_scraper(url)
-            elif tool == "Selenium":
-                result = selenium_scraper(url)
-            elif tool == "Scrapy":
-                result = scrapy_scraper(url)
+            # Fetch once for the AI prompt and any tool that parses the same
+            # bytes; Scrapy pages come through aiohttp so they aren't downloaded twice
+            content = None
+            if tool == "Scrapy" and ai_enabled:
+                content = get_async_page_content(url)
+            elif ai_enabled or tool == "BeautifulSoup":
+                content = get_page_content(url)
+            if shares_content:
+                scraper_future = submit(SCRAPERS[tool], url, content)
+            
+            # Build the prompt text on the pool too, in parallel with the scraper's parse
+            use_ai = ai_enabled and not isinstance(content, str)
+            if use_ai:
+                prompt_future = submit(prompt_text, content)
+            
+            # Stream the LLM answer here while the scraper runs on the pool
+            if use_ai:
+                model = LLM_LARGE_MODEL if large_model else LLM_MODEL
+                page_text = prompt_future.result()
+                with st.expander("AI Suggested Questions", expanded=True):
+                    answer = lookup_answer(model, page_text)
+                    if answer is not None:
+                        st.write(answer)
+                    else:
+                        answer = st.write_stream(generate_ai_questions(page_text, model))
+                        store_answer(model, page_text, answer)
             
+            result = scraper_future.result()
             st.session_state.scraping_result = result
 
 with col2:
@@ -225,24 +535,24 @@ with col2:
 with st.expander("Tool Documentation"):
     st.markdown("""
     **BeautifulSoup**: Best for static HTML pages
-    - Fast parsing
-    - CSS selector support
-    - Limited JavaScript handling
+    - Fast lxml (C) parsing
+    - Headers, related links and text extraction
+    - No JavaScript handling
     
     **Selenium**: Ideal for JavaScript-heavy sites
     - Real browser simulation
     - Interactive element handling
     - Slower performance
     
-    **Scrapy**: Professional scraping
-    - Built-in asynchronous handling
-    - Middleware support
-    - Complex setup
+    **Scrapy**: Lightweight async fetch
+    - Non-blocking aiohttp request
+    - Title and text extraction
+    - Repeatable without restarting the app
     """)
 
 # Usage tips
 st.info("""💡 Pro Tips: 
 - Start with BeautifulSoup for basic sites
 - Use Selenium for dynamic content or if getting 403 errors
-- Choose Scrapy for large-scale projects
+- Choose Scrapy for quick, repeatable text extraction
 - Check browser console for errors if scraping fails""")